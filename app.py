@@ -1,59 +1,17 @@
 import streamlit as st
 import pandas as pd
-import os
-import math
 from streamlit_geolocation import streamlit_geolocation
-import numpy as np
+from kirotei.core import calculate_distance, list_csvs, load_all_data
 
-# --- 1. 基本設定とヘルパー関数の定義 ---
+# --- 1. 基本設定 ---
 
 st.set_page_config(layout="centered", page_title="最寄りキロ程検索")
 
 # データが格納されているフォルダのパス
 DATA_DIR = "data"
 
-# NumPyを使った高速な距離計算関数
-def calculate_distance_vectorized(lat1, lon1, lat2_array, lon2_array):
-    """ユーザーの緯度経度と全データの緯度経度から一度に距離を計算する"""
-    R = 6371e3
-    lat1_rad, lon1_rad = np.radians(lat1), np.radians(lon1)
-    lat2_rad, lon2_rad = np.radians(lat2_array), np.radians(lon2_array)
-    dlon, dlat = lon2_rad - lon1_rad, lat2_rad - lat1_rad
-    a = np.sin(dlat / 2)**2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2)**2
-    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
-    return R * c
-
-# データを読み込む関数（キャッシュで高速化）
-@st.cache_data
-def load_all_data(data_dir):
-    """dataフォルダ内の全CSVを読み込み、一つのDataFrameに結合する"""
-    all_csv_files = []
-    try:
-        all_csv_files = [f for f in os.listdir(data_dir) if f.endswith('.csv')]
-    except FileNotFoundError:
-        return pd.DataFrame(), False
-
-    if not all_csv_files:
-        return pd.DataFrame(), True
-
-    df_list = []
-    for file_name in all_csv_files:
-        file_path = os.path.join(data_dir, file_name)
-        try:
-            df = pd.read_csv(file_path, low_memory=False)
-            if 'Lat' in df.columns and 'Lon' in df.columns:
-                df['Lat'] = pd.to_numeric(df['Lat'], errors='coerce')
-                df['Lon'] = pd.to_numeric(df['Lon'], errors='coerce')
-                df.dropna(subset=['Lat', 'Lon'], inplace=True)
-                df_list.append(df)
-        except Exception:
-            pass
-    
-    if not df_list:
-        return pd.DataFrame(), True
-        
-    master_data = pd.concat(df_list, ignore_index=True)
-    return master_data, True
+# 前回の検索位置からこの距離 (m) 未満しか動いていなければ再計算しない
+MIN_MOVE_M = 5.0
 
 # --- 2. StreamlitアプリのUIとメイン処理 ---
 
@@ -61,7 +19,8 @@ st.title("🛰️ 最寄りキロ程検索ツール (リアルタイム版)")
 st.write(f"あなたの現在地が更新されるたびに、最も近い地点の情報を自動で検索・表示します。")
 
 # 全データの読み込み
-master_data, success = load_all_data(DATA_DIR)
+csv_files = list_csvs(DATA_DIR)
+master_data, nearest_index, success = load_all_data(DATA_DIR, csv_files)
 
 if not success:
     st.error(f"'{DATA_DIR}' フォルダが見つかりません。")
@@ -84,12 +43,20 @@ else:
         user_lon = location['longitude']
         
         with st.spinner("現在地が更新されました。最寄り地点を再計算中..."):
-            lat_array = master_data['Lat'].values
-            lon_array = master_data['Lon'].values
-            distances = calculate_distance_vectorized(user_lat, user_lon, lat_array, lon_array)
-            nearest_idx = np.argmin(distances)
+            # 同じデータで、前回の検索位置からほとんど動いていなければ前回の結果を使う
+            last = st.session_state.get('last_search')
+            if (last and last['csv_files'] == csv_files
+                    and calculate_distance(user_lat, user_lon, *last['fix']) < MIN_MOVE_M):
+                nearest_idx, min_distance = last['nearest_idx'], last['min_distance']
+            else:
+                nearest_idx, min_distance = nearest_index.query(user_lat, user_lon)
+                st.session_state['last_search'] = {
+                    'csv_files': csv_files,
+                    'fix': (user_lat, user_lon),
+                    'nearest_idx': nearest_idx,
+                    'min_distance': min_distance,
+                }
             nearest_point = master_data.iloc[nearest_idx]
-            min_distance = distances[nearest_idx]
 
             # --- 結果表示 ---
             with results_placeholder.container():
@@ -0,0 +1,5 @@
+"""最寄りキロ程検索ツールの共通モジュール"""
+
+from kirotei.core import NearestIndex, calculate_distance, list_csvs, load_all_data, load_csv
+
+__all__ = ['NearestIndex', 'calculate_distance', 'list_csvs', 'load_all_data', 'load_csv']
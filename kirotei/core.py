@@ -0,0 +1,139 @@
+"""最寄りキロ程検索のデータ読み込みと最近傍探索（各アプリ共通）"""
+
+import streamlit as st
+import pandas as pd
+import os
+import csv
+import math
+import json
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from sklearn.neighbors import BallTree
+
+# 結合済みデータのキャッシュを置くフォルダ名 (DATA_DIRの中に作る)
+CACHE_DIR_NAME = "_cache"
+
+# CSVから読み込む列 (検索とアプリの表示に使う列だけをパースする)
+NEEDED_COLS = ['Lat', 'Lon', 'Distance', '踏切名', '線名', '支社名', '箇所名（系統名なし）', '踏切種別', 'Line']
+
+# 地球の半径 (m)
+EARTH_RADIUS_M = 6371e3
+
+# CSVを並列に読み込むスレッド数の上限
+MAX_READ_WORKERS = 8
+
+# 2点間の距離を計算する関数
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """2点の緯度経度からハバーサイン公式で距離 (m) を計算する"""
+    lat1_rad, lat2_rad = math.radians(lat1), math.radians(lat2)
+    dlat, dlon = lat2_rad - lat1_rad, math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2)**2
+    return EARTH_RADIUS_M * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+# 結合済みデータをParquetキャッシュから読み込む関数
+def load_cached_master(cache_dir, manifest):
+    """CSVの更新時刻が前回保存時と同じなら、Parquetキャッシュを読み込んで返す"""
+    try:
+        with open(os.path.join(cache_dir, 'manifest.json'), encoding='utf-8') as f:
+            if json.load(f) != manifest:
+                return None
+        return pd.read_parquet(os.path.join(cache_dir, 'master.parquet'), engine='pyarrow')
+    except Exception:
+        return None
+
+# 結合済みデータをParquetキャッシュに保存する関数
+def save_cached_master(cache_dir, manifest, master_data):
+    """結合済みデータとCSVの更新時刻一覧を保存する（失敗しても処理は続ける）"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        master_data.to_parquet(os.path.join(cache_dir, 'master.parquet'), engine='pyarrow', index=False)
+        # Parquetの書き込みが終わってから更新時刻一覧を書き、中途半端なキャッシュを使わないようにする
+        with open(os.path.join(cache_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+    except Exception:
+        pass
+
+# CSVファイルの一覧を取得する関数（キャッシュで高速化）
+@st.cache_data(ttl=60)
+def list_csvs(data_dir):
+    """dataフォルダ内のCSVファイル名と更新時刻の一覧を返す（フォルダが無ければNone）"""
+    try:
+        file_names = sorted(f for f in os.listdir(data_dir) if f.endswith('.csv'))
+    except FileNotFoundError:
+        return None
+    return tuple((f, os.path.getmtime(os.path.join(data_dir, f))) for f in file_names)
+
+# CSVを1ファイル読み込む関数（キャッシュで高速化）
+@st.cache_data
+def load_csv(file_path, mtime):
+    """CSVをArrowのTableとして読み込み、Lat/Lonを数値に変換する（mtimeはファイル更新時にキャッシュを無効化するためのキー）"""
+    # ヘッダー行だけ先に読み、このファイルにある必要な列だけをパースさせる
+    with open(file_path, encoding='utf-8-sig', newline='') as f:
+        header = next(csv.reader(f), [])
+    if 'Lat' not in header or 'Lon' not in header:
+        return None
+    columns = [col for col in header if col in NEEDED_COLS]
+    table = pacsv.read_csv(file_path, convert_options=pacsv.ConvertOptions(include_columns=columns))
+    # 数値に変換できないLat/Lonは欠損扱いにし、欠損のある行を除く
+    for col in ('Lat', 'Lon'):
+        values = pd.to_numeric(table[col].to_pandas(), errors='coerce')
+        table = table.set_column(table.schema.get_field_index(col), col, pa.array(values, type=pa.float64()))
+    return table.filter(pc.and_(pc.is_valid(table['Lat']), pc.is_valid(table['Lon'])))
+
+# 最近傍探索用のインデックス
+class NearestIndex:
+    """全データの緯度経度から作ったハバーサイン距離のBallTreeで、最寄り地点を探す"""
+
+    def __init__(self, lat_array, lon_array):
+        # 緯度経度をラジアンに変換し、BallTreeを一度だけ構築する
+        coords_rad = np.radians(np.column_stack([lat_array, lon_array]).astype(np.float64))
+        self.tree = BallTree(coords_rad, metric='haversine')
+
+    def query(self, lat, lon):
+        """指定した緯度経度に最も近い地点の行番号と、そこまでの距離 (m) を返す"""
+        dist_rad, idx = self.tree.query(np.radians([[lat, lon]]), k=1)
+        return int(idx[0, 0]), dist_rad[0, 0] * EARTH_RADIUS_M
+
+# データを読み込む関数（キャッシュで高速化）
+@st.cache_resource(max_entries=1)
+def load_all_data(data_dir, csv_files):
+    """CSV一覧の全ファイルを一つのDataFrameに結合し、最近傍探索用のNearestIndexを作る"""
+    if csv_files is None:
+        return pd.DataFrame(), None, False
+
+    if not csv_files:
+        return pd.DataFrame(), None, True
+
+    cache_dir = os.path.join(data_dir, CACHE_DIR_NAME)
+    # 読み込む列が変わったときもキャッシュを作り直すよう、列一覧も一緒に記録する
+    manifest = {'columns': NEEDED_COLS, 'files': dict(csv_files)}
+    master_data = load_cached_master(cache_dir, manifest)
+
+    if master_data is None:
+        def read_one(csv_file):
+            file_name, mtime = csv_file
+            try:
+                return load_csv(os.path.join(data_dir, file_name), mtime)
+            except Exception:
+                return None
+
+        # CSVのパースはGILを解放するので、ファイル単位でスレッドに分けて読み込む
+        with ThreadPoolExecutor(max_workers=min(MAX_READ_WORKERS, len(csv_files))) as executor:
+            tables = [table for table in executor.map(read_one, csv_files) if table is not None]
+
+        if not tables:
+            return pd.DataFrame(), None, True
+
+        try:
+            # Arrow上で結合してからpandasへ一度だけ変換し、結合時のコピーを避ける
+            master_data = pa.concat_tables(tables, promote_options='permissive').to_pandas(self_destruct=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # ファイル間で列の型が食い違う場合はpandasで結合する
+            master_data = pd.concat([t.to_pandas() for t in tables], ignore_index=True)
+        save_cached_master(cache_dir, manifest, master_data)
+
+    index = NearestIndex(master_data['Lat'].to_numpy(), master_data['Lon'].to_numpy())
+    return master_data, index, True